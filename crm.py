@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+
+# Coefficients du bonus-malus (article A121-1 du Code des assurances)
+CRM_BONUS = 0.95  # année sans sinistre responsable
+CRM_MALUS_TOTAL = 1.25  # par sinistre totalement responsable
+CRM_MALUS_PARTIAL = 1.125  # par sinistre partiellement responsable
+CRM_MIN = 0.50
+CRM_MAX = 3.50
+
+# Nombre de mois entre la fin de la période de référence et l'échéance annuelle
+REFERENCE_PERIOD_OFFSET_MONTHS = 2
+# Années au bonus maximal donnant droit à la franchise du premier sinistre
+BONUS_FRANCHISE_YEARS = 3
+
+# Convertir une liste de dates en tableau datetime64
+def _to_datetime64(dates):
+    """Convertit des dates (date, datetime, chaîne ISO ou datetime64) en tableau datetime64[ns] trié."""
+    return np.sort(pd.to_datetime(pd.Series(list(dates), dtype=object)).to_numpy(dtype="datetime64[ns]"))
+
+# Répartir les sinistres entre les périodes de référence
+def _claims_per_period(claim_dates, contract_start, period_ends):
+    """Compte les sinistres de chaque période de référence [début, fin[ en une passe vectorisée.
+
+    La première période commence à contract_start, même si elle dure alors moins de 12 mois.
+    """
+    if claim_dates.size == 0:
+        return np.zeros(period_ends.size, dtype=np.int64)
+    # Les sinistres antérieurs au contrat ou postérieurs à la dernière période sont ignorés
+    in_range = (claim_dates >= contract_start) & (claim_dates < period_ends[-1])
+    bucket_idx = np.searchsorted(period_ends, claim_dates[in_range], side="right")
+    return np.bincount(bucket_idx, minlength=period_ends.size)[:period_ends.size]
+
+# Arrondir le coefficient comme le prévoit le Code des assurances
+def _round_crm(value):
+    """Arrondit le coefficient à la deuxième décimale par défaut et le borne entre 0,50 et 3,50."""
+    return min(max(np.floor(value * 100 + 1e-9) / 100, CRM_MIN), CRM_MAX)
+
+# Calculer l'évolution du CRM sur la durée du contrat
+def compute_crm(responsible_dates, contract_start, contract_end, initial_crm=1.0, partial_dates=()):
+    """Calcule le CRM à chaque échéance annuelle entre contract_start et contract_end.
+
+    Chaque échéance tient compte des sinistres survenus pendant la période de référence de 12 mois
+    se terminant 2 mois avant elle (la première commence à la souscription). Applique le bonus, le malus, la descente rapide (retour à 1,00
+    après deux années consécutives sans sinistre responsable) et la franchise du premier sinistre
+    après 3 ans au bonus maximal. Retourne un DataFrame avec une ligne par échéance.
+    """
+    start = pd.Timestamp(contract_start)
+    end = pd.Timestamp(contract_end)
+
+    # Échéances annuelles (date anniversaire du contrat) et périodes de référence associées
+    echeances = []
+    year = 1
+    while start + pd.DateOffset(years=year) <= end:
+        echeances.append(start + pd.DateOffset(years=year))
+        year += 1
+    columns = ["echeance", "debut_periode", "fin_periode", "sinistres_responsables", "sinistres_partiels", "crm"]
+    if not echeances:
+        return pd.DataFrame(columns=columns)
+    echeances = pd.DatetimeIndex(echeances)
+    period_ends = (echeances - pd.DateOffset(months=REFERENCE_PERIOD_OFFSET_MONTHS)).to_numpy(dtype="datetime64[ns]")
+    period_starts = (echeances - pd.DateOffset(months=12 + REFERENCE_PERIOD_OFFSET_MONTHS)).to_numpy(dtype="datetime64[ns]")
+    period_starts = np.maximum(period_starts, start.to_datetime64())
+
+    total = _claims_per_period(_to_datetime64(responsible_dates), start.to_datetime64(), period_ends)
+    partial = _claims_per_period(_to_datetime64(partial_dates), start.to_datetime64(), period_ends)
+
+    # Deux années consécutives sans sinistre : descente rapide possible à la seconde échéance
+    claim_free = (total + partial) == 0
+    two_free_years = np.r_[False, np.convolve(claim_free, [1, 1], "valid") == 2]
+
+    crm_values = np.empty(echeances.size)
+    crm = float(initial_crm)
+    years_at_min = 0
+    for k in range(echeances.size):
+        total_k, partial_k = int(total[k]), int(partial[k])
+        if claim_free[k]:
+            crm *= CRM_BONUS
+            if two_free_years[k] and crm > 1.0:
+                crm = 1.0
+        else:
+            # Franchise de bonus : le premier sinistre ne majore pas le coefficient
+            if years_at_min >= BONUS_FRANCHISE_YEARS:
+                if total_k:
+                    total_k -= 1
+                else:
+                    partial_k -= 1
+            crm *= CRM_MALUS_TOTAL ** total_k * CRM_MALUS_PARTIAL ** partial_k
+        crm = _round_crm(crm)
+        years_at_min = years_at_min + 1 if crm == CRM_MIN and claim_free[k] else 0
+        crm_values[k] = crm
+
+    return pd.DataFrame({
+        "echeance": echeances.date,
+        "debut_periode": pd.DatetimeIndex(period_starts).date,
+        "fin_periode": pd.DatetimeIndex(period_ends).date,
+        "sinistres_responsables": total,
+        "sinistres_partiels": partial,
+        "crm": crm_values,
+    }, columns=columns)
+
+# Présenter le calcul du CRM dans le prompt envoyé à Gemini
+def crm_table_markdown(crm_table):
+    """Convertit le résultat de compute_crm en tableau Markdown (dates JJ/MM/AAAA, CRM avec virgule)."""
+    lines = [
+        "| Échéance | Période de référence | Sinistres responsables | Sinistres partiels | CRM |",
+        "|---|---|---|---|---|",
+    ]
+    for row in crm_table.itertuples(index=False):
+        crm = f"{row.crm:.2f}".replace(".", ",")
+        lines.append(
+            f"| {row.echeance:%d/%m/%Y} | {row.debut_periode:%d/%m/%Y} – {row.fin_periode:%d/%m/%Y} "
+            f"| {row.sinistres_responsables} | {row.sinistres_partiels} | {crm} |"
+        )
+    return "\n".join(lines)
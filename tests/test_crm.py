@@ -0,0 +1,59 @@
+from datetime import date
+
+import pytest
+
+from crm import compute_crm, crm_table_markdown
+
+START = date(2020, 1, 1)
+
+
+def crm_values(table):
+    return list(table["crm"])
+
+
+def test_sequence_sans_sinistre():
+    table = compute_crm([], START, date(2024, 1, 1))
+    assert crm_values(table) == pytest.approx([0.95, 0.90, 0.85, 0.80])
+
+
+def test_arrondi_par_defaut():
+    # 1,25 × 0,95 = 1,1875 : arrondi à 1,18 et non 1,19
+    table = compute_crm([date(2020, 3, 15)], START, date(2022, 1, 1))
+    assert crm_values(table) == pytest.approx([1.25, 1.18])
+
+
+def test_plancher_bonus_maximal():
+    table = compute_crm([], START, date(2023, 1, 1), initial_crm=0.50)
+    assert crm_values(table) == pytest.approx([0.50, 0.50, 0.50])
+
+
+def test_plafond_malus_maximal():
+    table = compute_crm([date(2020, 3, 15)], START, date(2021, 1, 1), initial_crm=3.0)
+    assert crm_values(table) == pytest.approx([3.50])
+
+
+def test_descente_rapide_apres_deux_ans_sans_sinistre():
+    table = compute_crm([], START, date(2022, 1, 1), initial_crm=1.5)
+    assert crm_values(table) == pytest.approx([1.42, 1.00])
+
+
+def test_sinistres_total_et_partiel_la_meme_annee():
+    # 1,25 × 1,125 = 1,40625
+    table = compute_crm([date(2020, 3, 15)], START, date(2021, 1, 1), partial_dates=[date(2020, 6, 1)])
+    assert list(table["sinistres_responsables"]) == [1]
+    assert list(table["sinistres_partiels"]) == [1]
+    assert crm_values(table) == pytest.approx([1.40])
+
+
+def test_periode_de_reference():
+    # Première période : de la souscription à 2 mois avant l'échéance ; les sinistres antérieurs au contrat sont ignorés
+    table = compute_crm([date(2019, 12, 1), date(2020, 11, 15)], START, date(2022, 1, 1))
+    assert table["debut_periode"][0] == START
+    assert table["fin_periode"][0] == date(2020, 11, 1)
+    assert list(table["sinistres_responsables"]) == [0, 1]
+    assert crm_values(table) == pytest.approx([0.95, 1.18])
+
+
+def test_tableau_markdown():
+    markdown = crm_table_markdown(compute_crm([], START, date(2021, 1, 1)))
+    assert "| 01/01/2021 | 01/01/2020 – 01/11/2020 | 0 | 0 | 0,95 |" in markdown